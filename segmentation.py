@@ -9,7 +9,15 @@ Example:
     同様に出力結果を TextGrid ファイルとして保存することも可能です::
         $ python ./segmentation.py -i ./sample/sample.wav -t "きょうわいいてんきだ" -o sample.TextGrid
 
+    同じ音声を繰り返しアラインメントする場合は特徴量キャッシュを使用できます.
+    ただし特徴量は julius とは別の実装で計算するため, 境界が異なることがあります::
+        $ python ./segmentation.py -i ./sample/sample.wav -t "きょうわいいてんきだ" --feature-cache
+
+    前後の無音区間を切り落としてからアラインメントすることも可能です::
+        $ python ./segmentation.py -i ./sample/sample.wav -t "きょうわいいてんきだ" --vad
+
 """
+import atexit
 from os import path
 
 
@@ -24,10 +32,55 @@ class Julius(object):
     '0.0 0.23 0.32 0.56 0.68 0.76 0.98 1.07 1.17 1.27 1.39 1.44 1.5 1.6'
     >>> " ".join([str(x["end"]) for x in julius.result])
     '0.23 0.32 0.56 0.68 0.76 0.98 1.07 1.17 1.27 1.39 1.44 1.5 1.6 2.04'
+
+    特徴量キャッシュを使用した場合は julius とは別の実装で特徴量を計算するため,
+    境界は一致するとは限りません (ここでは 20ms 以内の差を許容します).
+
+    >>> cached = Julius("sample/sample.wav", "きょうわいいてんきだ",
+    ...                 feature_cache=True)
+    >>> cached.run_segmentation()
+    >>> texts = [x["text"] for x in julius.result]
+    >>> [x["text"] for x in cached.result] == texts
+    True
+    >>> max(
+    ...     max(abs(a["start"] - b["start"]), abs(a["end"] - b["end"]))
+    ...     for a, b in zip(cached.result, julius.result)
+    ... ) <= 0.02
+    True
+
+    vad=True の場合は前後の無音を切り落としてアラインメントし,
+    結果を元の音声の時間軸に戻します.
+    特徴量キャッシュを使用する場合, 2 回目は保存された offset/trimmed を使用します.
+
+    >>> from tempfile import mkdtemp
+    >>> from pydub import AudioSegment
+    >>> sound = AudioSegment.from_file("sample/sample.wav")
+    >>> padded = path.join(mkdtemp(), "padded.wav")
+    >>> _ = (
+    ...     AudioSegment.silent(2000, sound.frame_rate) + sound +
+    ...     AudioSegment.silent(3000, sound.frame_rate)
+    ... ).export(padded, format="wav")
+    >>> for feature_cache in [False, True, True]:
+    ...     trimmed = Julius(padded, "きょうわいいてんきだ", vad=True,
+    ...                      feature_cache=feature_cache)
+    ...     trimmed.run_segmentation()
+    ...     print(
+    ...         [x["text"] for x in trimmed.result] == texts,
+    ...         trimmed.offset > 0, trimmed.trimmed,
+    ...         trimmed.result[0]["start"],
+    ...         trimmed.result[-1]["end"] == round(trimmed.duration, 2)
+    ...     )
+    True True True 0.0 True
+    True True True 0.0 True
+    True True True 0.0 True
     """
     cdir = None
     bname = None
     wav = None
+    mfc = None
+    duration = None
+    offset = 0.0
+    trimmed = False
     dic = None
     dfa = None
     model = None
@@ -35,10 +88,18 @@ class Julius(object):
     _sound = None
     _row = None
 
-    def __init__(self, wav, text, model=None):
+    def __init__(self, wav, text, model=None, feature_cache=False,
+                 vad=False, vad_threshold=15.0, vad_padding=0.3):
         self.check_cache()
         self.bname, _ = path.splitext(path.basename(wav))
-        self.check_sound(wav)
+        if vad:
+            vad = {"threshold": vad_threshold, "padding": vad_padding}
+        else:
+            vad = None
+        if feature_cache:
+            self.check_feature(wav, vad=vad)
+        else:
+            self.check_sound(wav, vad=vad)
         self.create_text_info(text)
         if model:
             self.model = model
@@ -60,18 +121,89 @@ class Julius(object):
             makedirs(cdir)
         self.cdir = cdir
 
-    def check_sound(self, fpath, format="wav"):
-        """音声ファイルを読み込み julius に適した形に変更します"""
+    def check_sound(self, fpath, format="wav", vad=None):
+        """音声ファイルを読み込み julius に適した形に変更します
+
+        vad (detect_speech の引数) を与えた場合, 前後の無音区間を切り落とします.
+        """
+        sound = self.load_sound(fpath, format, vad)
+        output = path.join(self.cdir, "{}.wav".format(self.bname))
+        sound.export(output, format="wav")
+        self.wav = output
+
+    def check_feature(self, fpath, format="wav", vad=None):
+        """音声ファイルの特徴量 (HTK パラメータファイル) を用意します.
+
+        特徴量は音声ファイルの内容のハッシュ値をキーとして
+        ~/.cache/julius/features 以下に保存されます.
+        既に保存されている場合は音声の読み込み, リサンプリング,
+        特徴量抽出を行わずにそれを使用します.
+        """
+        import json
+        from hashlib import sha1
+        fdir = path.join(self.cdir, "features")
+        if not path.exists(fdir):
+            from os import makedirs
+            makedirs(fdir)
+        options = {
+            "version": FEATURE_VERSION, "mfcc": MFCC_PARAMS, "vad": vad
+        }
+        key = "{}_{}".format(
+            sound_hash(fpath),
+            sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12]
+        )
+        output = path.join(fdir, "{}.mfc".format(key))
+        info = path.join(fdir, "{}.json".format(key))
+        # json は .mfc の後に書き込まれるため, json があれば .mfc も完全です
+        if path.exists(info) and path.exists(output):
+            with open(info) as f:
+                meta = json.load(f)
+            self.duration = meta["duration"]
+            self.offset = meta["offset"]
+            self.trimmed = meta["trimmed"]
+        else:
+            import numpy as np
+            sound = self.load_sound(fpath, format, vad)
+            samples = np.array(sound.get_array_of_samples(), np.float64)
+            feats = compute_mfcc(samples, sound.frame_rate, **MFCC_PARAMS)
+            replace_write(output, lambda tmp: write_htk(tmp, feats))
+            meta = {
+                "duration": self.duration,
+                "offset": self.offset,
+                "trimmed": self.trimmed,
+            }
+
+            def write_info(tmp):
+                with open(tmp, mode="w") as f:
+                    json.dump(meta, f)
+            replace_write(info, write_info)
+        self.mfc = output
+
+    def load_sound(self, fpath, format="wav", vad=None):
+        """音声ファイルを読み込み 16kHz モノラルに変換したものを返します
+
+        vad (detect_speech の引数) を与えた場合は発話区間 (と前後の余白)
+        のみを切り出し, 切り出し開始位置 (秒) を offset に,
+        実際に切り落とした区間があるかを trimmed に保存します.
+        """
         from pydub import AudioSegment
         sound = AudioSegment.from_file(fpath, format)
         self._sound = sound
+        self.duration = sound.duration_seconds
+        self.offset = 0.0
+        self.trimmed = False
         if sound.channels > 1:
             sound = sound.set_channels(1)
         if sound.frame_rate != 16000:
             sound = sound.set_frame_rate(16000)
-        output = path.join(self.cdir, "{}.wav".format(self.bname))
-        sound.export(output, format="wav")
-        self.wav = output
+        if vad:
+            import numpy as np
+            samples = np.array(sound.get_array_of_samples(), np.float64)
+            start, end = detect_speech(samples, sound.frame_rate, **vad)
+            sound = sound.get_sample_slice(start, end)
+            self.offset = start / float(sound.frame_rate)
+            self.trimmed = (start, end) != (0, len(samples))
+        return sound
 
     def create_text_info(self, text):
         """julius のセグメンテーションに必要なファイルを生成します"""
@@ -87,10 +219,26 @@ class Julius(object):
             f.write("\n".join(dfa))
         self.dfa = dfa_path
 
-    def run_segmentation(self, csj=True):
-        proc = run_julius(self.wav, self.model, self.dfa, self.dic)
+    def run_segmentation(self, csj=True, **options):
+        """julius を実行しアラインメント結果を result に格納します.
+
+        options (timeout, memory, cpu_time, nice, cpus) は
+        run_julius にそのまま渡されます.
+        """
         self.result = []
-        self._row = proc.communicate()[0]
+        try:
+            if self.mfc:
+                self._row = run_julius(
+                    self.mfc, self.model, self.dfa, self.dic,
+                    input_type="mfcfile", **options
+                )
+            else:
+                self._row = run_julius(
+                    self.wav, self.model, self.dfa, self.dic, **options
+                )
+        except Exception:
+            self.clean()
+            raise
         try:
             res = self._row.split("\n")
             s_index = res.index("=== begin forced alignment ===")
@@ -118,16 +266,23 @@ class Julius(object):
                     "text": text,
                 }
                 self.result.append(item)
+            if self.trimmed:
+                self.result = shift_segments(
+                    self.result, self.offset, self.duration
+                )
         except Exception:
             pass
         self.clean()
 
     def clean(self):
-        """種々中間ファイルが存在したら削除します"""
+        """種々中間ファイルが存在したら削除します
+
+        特徴量キャッシュは再利用のため削除しません.
+        """
         from os import remove
         if path.exists(self.dic):
             remove(self.dic)
-        if path.exists(self.wav):
+        if self.wav and path.exists(self.wav):
             remove(self.wav)
         if path.exists(self.dfa):
             remove(self.dfa)
@@ -147,24 +302,454 @@ class Julius(object):
 
     def to_textgrid(self, output):
         """認識結果を TextGrid 形式に変換します."""
-        create_textgrid(self._sound, {"SEGMENT": self.result}, output)
+        create_textgrid(self.duration, {"SEGMENT": self.result}, output)
+
+
+# julius プロセスの監視結果の集計
+JULIUS_STATS = {"runs": 0, "timeouts": 0, "kills": 0, "failures": 0}
 
+# 実行中の julius プロセス (終了時に回収する)
+_running = set()
 
-def run_julius(wav, model, dfa, dic):
-    from subprocess import Popen, PIPE, STDOUT
+# julius の起動に使用する Python. None の場合は sys.executable を使用します.
+# uwsgi 等の組み込みインタプリタでは sys.executable が Python を指さないため,
+# ここに Python のパスを設定してください.
+JULIUS_PYTHON = None
+
+# 資源制限と (Linux では) 親プロセス終了時の SIGKILL を設定してから
+# julius に exec するスクリプト.
+# 引数: 親 PID, メモリ上限, CPU 時間上限, nice 値, CPU 番号, julius コマンド
+_JULIUS_EXEC = "\n".join([
+    "import os, sys",
+    "ppid, memory, cpu_time, nice, cpus = sys.argv[1:6]",
+    "if sys.platform.startswith('linux'):",
+    "    import ctypes, signal",
+    "    ctypes.CDLL(None).prctl(1, signal.SIGKILL)  # PR_SET_PDEATHSIG",
+    "    if os.getppid() != int(ppid):",
+    "        sys.exit(1)",
+    "if memory or cpu_time:",
+    "    import resource",
+    "    if memory:",
+    "        resource.setrlimit(resource.RLIMIT_AS, (int(memory),) * 2)",
+    "    if cpu_time:",
+    "        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_time),) * 2)",
+    "if nice:",
+    "    os.nice(int(nice))",
+    "if cpus:",
+    "    os.sched_setaffinity(0, [int(x) for x in cpus.split(',')])",
+    "os.execvp(sys.argv[6], sys.argv[6:])",
+])
+
+
+def run_julius(wav, model, dfa, dic, input_type="file", timeout=None,
+               memory=None, cpu_time=None, nice=None, cpus=None):
+    """julius を実行し, その出力を返します.
+
+    POSIX 環境では julius は独立したプロセスグループで起動され,
+    正常終了, タイムアウト, 例外のいずれの場合もグループごと回収されます.
+    資源制限は julius の起動前に設定されます.
+    Linux では呼び出し元のプロセスが異常終了した場合も SIGKILL されます.
+
+    Args:
+        timeout: 実時間の制限 (秒). 超過すると TimeoutExpired を送出します
+        memory: アドレス空間の上限 (バイト, RLIMIT_AS. POSIX のみ)
+        cpu_time: CPU 時間の上限 (秒, RLIMIT_CPU. POSIX のみ)
+        nice: julius プロセスに加算する nice 値 (POSIX のみ)
+        cpus: julius を割り当てる CPU 番号の集合 (Linux のみ)
+
+    Raises:
+        CalledProcessError: julius が異常終了した場合 (資源制限の超過を含む)
+        NotImplementedError: 指定した制限がこの環境で使用できない場合
+    """
+    from subprocess import Popen, PIPE, STDOUT, CalledProcessError
     cmds = [
         "julius", "-h", model, "-dfa", dfa, "-v", dic, "-palign", "-input",
-        "file"
+        input_type
     ]
-    proc = Popen(["echo", wav], stdout=PIPE, stderr=STDOUT)
-    proc2 = Popen(
-        cmds,
-        stdin=proc.stdout,
+    proc = Popen(
+        _julius_command(cmds, memory, cpu_time, nice, cpus),
+        stdin=PIPE,
         stdout=PIPE,
         stderr=STDOUT,
-        universal_newlines=True
+        universal_newlines=True,
+        start_new_session=True
     )
-    return proc2
+    _running.add(proc)
+    JULIUS_STATS["runs"] += 1
+    try:
+        output = _communicate(proc, "{}\n".format(wav), timeout)
+    finally:
+        _kill_julius(proc)
+    if proc.returncode != 0:
+        JULIUS_STATS["failures"] += 1
+        raise CalledProcessError(proc.returncode, cmds, output)
+    return output
+
+
+def _julius_command(cmds, memory=None, cpu_time=None, nice=None, cpus=None):
+    """資源制限を設定してから cmds を実行するコマンドを返します.
+
+    >>> from subprocess import check_output
+    >>> cmds = _julius_command(
+    ...     ["sh", "-c", "ulimit -v; ulimit -t"], memory=1 << 30, cpu_time=5
+    ... )
+    >>> check_output(cmds, universal_newlines=True).split()
+    ['1048576', '5']
+    """
+    import os
+    import sys
+    limits = [memory, cpu_time, nice, cpus]
+    if all(x is None for x in limits):
+        limits = None
+    if os.name != "posix":
+        if limits:
+            raise NotImplementedError(
+                "資源制限 (memory, cpu_time, nice, cpus) は"
+                " POSIX 環境でのみ使用できます"
+            )
+        return cmds
+    if cpus is not None and not hasattr(os, "sched_setaffinity"):
+        raise NotImplementedError(
+            "この環境では CPU の割り当て (cpus) を使用できません"
+        )
+    python = JULIUS_PYTHON or sys.executable
+    if not python:
+        if limits:
+            raise RuntimeError(
+                "Python の実行ファイルが不明です. "
+                "segmentation.JULIUS_PYTHON を設定してください"
+            )
+        return cmds
+    args = [
+        "" if x is None else str(x)
+        for x in [memory, cpu_time, nice]
+    ]
+    args.append(",".join(str(x) for x in sorted(cpus)) if cpus else "")
+    return [python, "-c", _JULIUS_EXEC, str(os.getpid())] + args + cmds
+
+
+def _communicate(proc, input, timeout=None):
+    """julius に入力を与え, 終了するまでの出力を返します.
+
+    POSIX 環境では julius を回収 (wait) せずに終了を待つため,
+    その後のプロセスグループへのシグナルが他のプロセスに届くことはありません.
+    """
+    import os
+    import threading
+    from subprocess import TimeoutExpired
+    if os.name != "posix":
+        try:
+            return proc.communicate(input, timeout=timeout)[0]
+        except TimeoutExpired:
+            JULIUS_STATS["timeouts"] += 1
+            raise
+    chunks = []
+
+    def read():
+        chunks.append(proc.stdout.read())
+        try:
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        except ChildProcessError:
+            pass
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        proc.stdin.write(input)
+    except BrokenPipeError:
+        pass
+    try:
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    reader.join(timeout)
+    if reader.is_alive():
+        JULIUS_STATS["timeouts"] += 1
+        _kill_julius(proc)
+        reader.join()
+        proc.stdout.close()
+        raise TimeoutExpired(proc.args, timeout)
+    proc.stdout.close()
+    return chunks[0]
+
+
+def _kill_julius(proc):
+    """julius のプロセスグループを終了させ, 回収します.
+
+    julius が既に回収済みの場合, そのプロセスグループ ID は
+    再利用されている可能性があるためシグナルを送りません.
+
+    >>> import signal
+    >>> from subprocess import Popen
+    >>> kills = JULIUS_STATS["kills"]
+    >>> proc = Popen(["sh", "-c", "sleep 10 & sleep 10"],
+    ...              start_new_session=True)
+    >>> _kill_julius(proc)
+    >>> proc.returncode == -signal.SIGKILL, JULIUS_STATS["kills"] - kills
+    (True, 1)
+    """
+    import os
+    import signal
+    _running.discard(proc)
+    if proc.returncode is not None:
+        return
+    if os.name != "posix":
+        if proc.poll() is None:
+            JULIUS_STATS["kills"] += 1
+            proc.kill()
+    else:
+        # 未回収 (ゾンビを含む) の間はグループ ID が julius のものであることが
+        # 保証されるため, 終了済みでも残りのプロセスごと終了させる
+        status = os.waitid(
+            os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT
+        )
+        if status is None:
+            JULIUS_STATS["kills"] += 1
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    proc.wait()
+
+
+def _reap_julius():
+    for proc in list(_running):
+        _kill_julius(proc)
+
+
+atexit.register(_reap_julius)
+
+
+def sound_hash(fpath, chunk_size=1 << 20):
+    """音声ファイルの内容から特徴量キャッシュのキーを生成します."""
+    from hashlib import sha1
+    h = sha1()
+    with open(fpath, mode="rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def replace_write(fpath, write):
+    """一時ファイルに書き込んだ後 fpath に置き換えます.
+
+    書き込み途中のファイルが他のプロセスから見えることはありません.
+    write は一時ファイルのパスを受け取り, そこに書き込む関数です.
+    """
+    import os
+    from tempfile import mkstemp
+    fd, tmp = mkstemp(dir=path.dirname(fpath), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, fpath)
+    except BaseException:
+        if path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# 特徴量キャッシュの形式を変更した場合は更新してください
+FEATURE_VERSION = 1
+
+# 特徴量キャッシュで使用する音響分析条件 (julius の既定値)
+MFCC_PARAMS = {
+    "frame_size": 400,
+    "frame_shift": 160,
+    "preemph": 0.97,
+    "fbank_num": 24,
+    "mfcc_dim": 12,
+    "lifter": 22,
+    "del_win": 2,
+}
+
+
+def compute_mfcc(samples, rate=16000, frame_size=400, frame_shift=160,
+                 preemph=0.97, fbank_num=24, mfcc_dim=12, lifter=22,
+                 del_win=2):
+    """音声波形から MFCC_E_D_N_Z 特徴量を計算します.
+
+    julius の既定の音響分析条件 (25ms 窓, 10ms シフト, 24 ch フィルタバンク,
+    12 次元 MFCC, ケプストラムリフタ 22) に従いますが, julius の音響分析と
+    ビット単位で一致するものではありません (フィルタバンクの近似など).
+    そのためこの特徴量によるアラインメント結果は julius に wav を
+    直接与えた場合と異なることがあります.
+    戻り値は (フレーム数, 2 * mfcc_dim + 1) の配列です.
+
+    >>> import numpy as np
+    >>> t = np.arange(16000) / 16000.0
+    >>> compute_mfcc(10000 * np.sin(2 * np.pi * 440 * t)).shape
+    (98, 25)
+    """
+    import numpy as np
+    x = np.asarray(samples, dtype=np.float64)
+    num = 1 + max(len(x) - frame_size, 0) // frame_shift
+    idx = (
+        np.arange(frame_size)[None, :] +
+        frame_shift * np.arange(num)[:, None]
+    )
+    frames = np.pad(x, (0, max(frame_size - len(x), 0)), mode="constant")
+    frames = frames[idx]
+
+    # HTK 互換のプリエンファシスとハミング窓
+    frames[:, 1:] -= preemph * frames[:, :-1]
+    frames[:, 0] *= 1.0 - preemph
+    frames *= np.hamming(frame_size)
+    energy = np.log(np.maximum((frames ** 2).sum(axis=1), 1.0))
+
+    fft_size = 1 << int(np.ceil(np.log2(frame_size)))
+    spec = np.abs(np.fft.rfft(frames, fft_size))
+
+    # メル尺度上で等間隔な三角フィルタバンク
+    def mel(f):
+        return 1127.0 * np.log(1.0 + f / 700.0)
+
+    centers = np.linspace(0.0, mel(rate / 2.0), fbank_num + 2)
+    bins = mel(np.arange(fft_size // 2 + 1) * rate / float(fft_size))
+    lower = centers[:-2, None]
+    center = centers[1:-1, None]
+    upper = centers[2:, None]
+    weights = np.maximum(
+        0.0, np.minimum((bins - lower) / (center - lower),
+                        (upper - bins) / (upper - center))
+    )
+    fbank = np.log(np.maximum(spec.dot(weights.T), 1.0))
+
+    dct = np.sqrt(2.0 / fbank_num) * np.cos(
+        np.pi / fbank_num * np.arange(1, mfcc_dim + 1)[:, None] *
+        (np.arange(1, fbank_num + 1)[None, :] - 0.5)
+    )
+    mfcc = fbank.dot(dct.T)
+    mfcc *= 1.0 + lifter / 2.0 * np.sin(
+        np.pi * np.arange(1, mfcc_dim + 1) / lifter
+    )
+    mfcc -= mfcc.mean(axis=0)
+
+    static = np.hstack([mfcc, energy[:, None]])
+    padded = np.pad(static, ((del_win, del_win), (0, 0)), mode="edge")
+    delta = sum(
+        t * (padded[del_win + t:len(padded) - del_win + t] -
+             padded[del_win - t:len(padded) - del_win - t])
+        for t in range(1, del_win + 1)
+    ) / (2.0 * sum(t * t for t in range(1, del_win + 1)))
+    return np.hstack([mfcc, delta]).astype(np.float32)
+
+
+# HTK パラメータ種別 MFCC_E_D_N_Z
+HTK_MFCC_E_D_N_Z = 6 | 0o100 | 0o200 | 0o400 | 0o4000
+
+
+def write_htk(fpath, feats, period=100000, kind=HTK_MFCC_E_D_N_Z):
+    """特徴量を HTK パラメータファイルとして保存します.
+
+    period はフレーム周期 (100ns 単位) です.
+    """
+    import numpy as np
+    from struct import pack
+    feats = np.asarray(feats, dtype=">f4")
+    num, dim = feats.shape
+    with open(fpath, mode="wb") as f:
+        f.write(pack(">iihh", num, period, dim * 4, kind))
+        f.write(feats.tobytes())
+
+
+def read_htk(fpath):
+    """HTK パラメータファイルを読み込みます.
+
+    >>> import numpy as np
+    >>> from tempfile import mkstemp
+    >>> _, fpath = mkstemp(suffix=".mfc")
+    >>> write_htk(fpath, np.ones((3, 25)))
+    >>> feats, period, kind = read_htk(fpath)
+    >>> feats.shape, period, kind == HTK_MFCC_E_D_N_Z
+    ((3, 25), 100000, True)
+    """
+    import numpy as np
+    from struct import unpack
+    with open(fpath, mode="rb") as f:
+        num, period, size, kind = unpack(">iihh", f.read(12))
+        feats = np.frombuffer(f.read(), dtype=">f4")
+    return feats.reshape(num, size // 4), period, kind
+
+
+def detect_speech(samples, rate=16000, frame_shift=0.01, threshold=15.0,
+                  padding=0.3, noise_percentile=10, min_speech=0.05):
+    """短時間エネルギーから発話区間を検出します.
+
+    フレームエネルギーの下位 noise_percentile パーセンタイルを雑音レベルとし,
+    雑音レベルより threshold (dB) 以上大きいフレームを発話とみなします.
+    ただし閾値は雑音レベルと最大エネルギーの中間を超えず,
+    (デジタル無音の場合のため) 最大エネルギーの 60 dB 下を下回りません.
+    min_speech (秒) より短い発話フレームの連続はクリック音等として無視します.
+    最初と最後の発話フレームに padding (秒) の余白を加えた
+    区間 (開始サンプル, 終了サンプル) を返します.
+    発話フレームが無い場合は全区間を返します.
+
+    >>> import numpy as np
+    >>> samples = np.zeros(32000)
+    >>> samples[16000:20000] = 1000 * np.sin(np.arange(4000))
+    >>> detect_speech(samples)
+    (11200, 24800)
+
+    定常的な背景雑音やクリック音がある場合も切り落とされます.
+
+    >>> noisy = samples * 2 + np.random.RandomState(0).normal(0, 100, 32000)
+    >>> noisy[5000] = 30000
+    >>> detect_speech(noisy)
+    (11200, 24800)
+    """
+    import numpy as np
+    x = np.asarray(samples, dtype=np.float64)
+    shift = int(rate * frame_shift)
+    num = len(x) // shift
+    if num == 0:
+        return 0, len(x)
+    power = (x[:num * shift].reshape(num, shift) ** 2).mean(axis=1)
+    db = 10.0 * np.log10(np.maximum(power, 1e-10))
+    peak = db.max()
+    floor = np.percentile(db, noise_percentile)
+    level = max(min(floor + threshold, (floor + peak) / 2.0), peak - 60.0)
+    # 発話フレームの連続区間のうち min_speech 以上のものを採用する
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], db > level, [0]])))
+    runs = edges.reshape(-1, 2)
+    min_frames = max(int(min_speech / frame_shift), 1)
+    runs = runs[runs[:, 1] - runs[:, 0] >= min_frames]
+    if peak <= -100.0 or len(runs) == 0:
+        return 0, len(x)
+    pad = int(rate * padding)
+    start = max(runs[0, 0] * shift - pad, 0)
+    end = min(runs[-1, 1] * shift + pad, len(x))
+    return int(start), int(end)
+
+
+def shift_segments(segments, offset, duration):
+    """切り出した音声に対するアラインメント結果を元の時間軸に戻します.
+
+    全区間を offset (秒) だけ後ろにずらし,
+    切り落とした前後の無音を先頭と末尾の区間に含めます.
+
+    >>> segs = [
+    ...     {"start": 0.0, "end": 0.3, "text": "#"},
+    ...     {"start": 0.3, "end": 0.5, "text": "a"},
+    ...     {"start": 0.5, "end": 0.8, "text": "#"},
+    ... ]
+    >>> [(x["start"], x["end"]) for x in shift_segments(segs, 0.7, 2.0)]
+    [(0.0, 1.0), (1.0, 1.2), (1.2, 2.0)]
+
+    発話が先頭から始まり末尾だけを切り落とした場合も末尾の無音を戻します.
+
+    >>> [(x["start"], x["end"]) for x in shift_segments(segs, 0.0, 10.0)]
+    [(0.0, 0.3), (0.3, 0.5), (0.5, 10.0)]
+    """
+    shifted = [
+        dict(
+            x, start=round(x["start"] + offset, 2),
+            end=round(x["end"] + offset, 2)
+        ) for x in segments
+    ]
+    if shifted:
+        shifted[0]["start"] = 0.0
+        shifted[-1]["end"] = max(shifted[-1]["end"], round(duration, 2))
+    return shifted
 
 
 def create_dict(text):
@@ -670,9 +1255,11 @@ def create_tier_text(name, i, duration, vals):
     templates.extend(intervals)
     return templates
 
-def create_textgrid(sound, tiers, output):
-    """認識結果を TextGrid 形式に変換します."""
-    duration = sound.duration_seconds
+def create_textgrid(duration, tiers, output):
+    """認識結果を TextGrid 形式に変換します.
+
+    duration には音声の長さ (秒) を指定します.
+    """
     templates = [
         'File type = "ooTextFile"',
         'Object class = "TextGrid"',
@@ -700,6 +1287,37 @@ if __name__ == "__main__":
     parser.add_argument(
         '--voca', help='セグメント表記を csj にしない', action='store_true'
     )
+    parser.add_argument(
+        '--feature-cache',
+        help='音響特徴量をキャッシュして再利用する'
+        ' (julius とは別実装の特徴量のため境界が異なることがある)',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--vad', help='前後の無音区間を切り落としてからアラインメントする',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--vad-threshold', type=float, default=15.0,
+        help='--vad で発話とみなす雑音レベルからのエネルギー差 (dB)'
+    )
+    parser.add_argument(
+        '--vad-padding', type=float, default=0.3,
+        help='--vad で発話区間の前後に残す余白 (秒)'
+    )
+    parser.add_argument(
+        '--timeout', help='julius の実行時間の上限 (秒)', type=float
+    )
+    parser.add_argument(
+        '--memory', help='julius の使用メモリの上限 (MB)', type=int
+    )
+    parser.add_argument(
+        '--cpu-time', help='julius の CPU 時間の上限 (秒)', type=int
+    )
+    parser.add_argument('--nice', help='julius の nice 値', type=int)
+    parser.add_argument(
+        '--cpus', help='julius を割り当てる CPU 番号 (カンマ区切り)'
+    )
     parser.add_argument('--test', help='doctest を実行', action='store_true')
 
     args = parser.parse_args()
@@ -707,10 +1325,23 @@ if __name__ == "__main__":
         import doctest
         doctest.testmod(verbose=True)
     else:
-        julius = Julius(args.input, args.text)
+        julius = Julius(
+            args.input, args.text, feature_cache=args.feature_cache,
+            vad=args.vad, vad_threshold=args.vad_threshold,
+            vad_padding=args.vad_padding
+        )
+        options = {
+            "timeout": args.timeout,
+            "memory": args.memory * 1024 * 1024 if args.memory else None,
+            "cpu_time": args.cpu_time,
+            "nice": args.nice,
+            "cpus": (
+                {int(x) for x in args.cpus.split(",")} if args.cpus else None
+            ),
+        }
         if args.voca:
-            julius.run_segmentation(csj=False)
-        julius.run_segmentation()
+            julius.run_segmentation(csj=False, **options)
+        julius.run_segmentation(**options)
         if args.output:
             _, ext = path.splitext(path.basename(args.output))
             if ".TEXTGRID" == ext.upper():